@@ -1,12 +1,24 @@
+import io
 import os
 import time
-from typing import List, Dict
+import mmap
+import asyncio
+import zipfile
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Tuple
+from urllib.parse import urlsplit
 import logging
 from datetime import datetime
 from dotenv import load_dotenv
 
-from langchain_community.document_loaders.git import GitLoader
-from langchain_core.documents import Document
+import httpx
+
+import xxhash
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
 
 from .mongo_setup import NigerianLawsDatabase
 
@@ -21,6 +33,54 @@ MONGO_COLLECTION_NAME = os.getenv("MONGO_COLLECTION_NAME")
 GITHUB_PERSONAL_ACCESS_TOKEN = os.getenv("GITHUB_PERSONAL_ACCESS_TOKEN")
 
 TARGET_GITHUB_REPO_URL: str = "https://github.com/mykeels/nigerian-laws"
+
+# Single hash lookup per file (and case-insensitive) instead of a chained
+# endswith scan over the extension tuple. No .docx: there is no extractor
+# for it here, and as a ZIP container it would only ingest as garbage.
+ALLOWED_EXTENSIONS = frozenset({".md", ".txt", ".pdf", ".html"})
+
+
+def _text_from_bytes(file_path: str, data: bytes) -> Optional[str]:
+    """
+    Extract text from raw file bytes with one extension dispatch shared by
+    the archive and clone paths. Returns None for unusable content: PDFs
+    that fail extraction, and files that are not valid UTF-8 (binary blobs
+    the baseline loader also skipped).
+    """
+    if os.path.splitext(file_path)[1].lower() == ".pdf":
+        from pypdf import PdfReader
+        try:
+            reader = PdfReader(io.BytesIO(data))
+            return "\n".join(page.extract_text() or "" for page in reader.pages)
+        except Exception as e:
+            logger.warning(f"Could not extract PDF text from {file_path}: {e}")
+            return None
+
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        logger.warning(f"Skipping non-UTF-8 file: {file_path}")
+        return None
+
+
+def _parse_file(path: str) -> Tuple[str, Optional[str]]:
+    """
+    Read one file via mmap and extract its text. Top-level so it pickles
+    into ProcessPoolExecutor workers; PDF extraction is CPU-bound and is
+    the reason parsing runs in separate processes.
+    """
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return path, ""
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                return path, _text_from_bytes(path, bytes(buffer))
+
+    except Exception as e:
+        logger.warning(f"Could not parse file {path}: {e}")
+        return path, None
     
 class DataCollector:
     
@@ -28,103 +88,376 @@ class DataCollector:
         
         self.db_manager = NigerianLawsDatabase(MONGO_URI, MONGO_DB_NAME)
         self.collection = self.db_manager.get_collection(MONGO_COLLECTION_NAME)
-        
+
+        self._pending: List[UpdateOne] = []
+        self._batch_size = 500
+        # save_document/flush run from worker threads when the async path
+        # falls back to threaded clone ingestion; the buffer is shared.
+        self._pending_lock = threading.Lock()
+
+        if self.collection is not None:
+            try:
+                # Upserts match on url; without this index every upsert is a
+                # collection scan. Unique also guards against duplicate docs
+                # from concurrent ingestion (bulk_write is ordered=False, so
+                # duplicate-key errors don't abort a batch).
+                self.collection.create_index([("url", ASCENDING)], unique=True)
+            except Exception as e:
+                logger.warning(f"Could not create unique index on 'url': {e}")
+
         logger.info("DataCollector initialized successfully.")
-    
+
+    @staticmethod
+    def _upsert_op(data: Dict) -> UpdateOne:
+        # Match only when the stored content_hash differs: unchanged files
+        # fail the match, the implied insert trips the unique url index, and
+        # the server does no write and logs nothing to the oplog.
+        return UpdateOne(
+            {'url': data.get('url'), 'content_hash': {'$ne': data.get('content_hash')}},
+            {'$set': data},
+            upsert=True
+        )
+
+    @staticmethod
+    def _real_write_errors(bulk_error: BulkWriteError) -> List[Dict]:
+        # Duplicate-key (11000) here just means "document unchanged" given
+        # the content-hash upsert filter, so it is not a failure.
+        return [
+            err for err in bulk_error.details.get('writeErrors', [])
+            if err.get('code') != 11000
+        ]
+
     def save_document(self, data: Dict) -> bool:
-        
-        unique_identifier = data.get('url')
-        
+
+        with self._pending_lock:
+            self._pending.append(self._upsert_op(data))
+            should_flush = len(self._pending) >= self._batch_size
+
+        if should_flush:
+            return self.flush()
+        return True
+
+    def flush(self) -> bool:
+        """
+        Send all buffered upserts to MongoDB in a single bulk_write call.
+        """
+        # Swap the buffer out under the lock so concurrent appends land in
+        # the fresh list instead of being cleared unsent; the network call
+        # happens outside the lock.
+        with self._pending_lock:
+            operations, self._pending = self._pending, []
+
+        if not operations:
+            return True
+
         try:
-            result = self.collection.update_one(
-                {'url': unique_identifier},
-                {'$set': data},
-                upsert=True
+            result = self.collection.bulk_write(operations, ordered=False)
+            logger.info(
+                f"Bulk write flushed {len(operations)} operations: "
+                f"{result.upserted_count} inserted, {result.modified_count} updated."
             )
-            
-            if result.upserted_id:
-                logger.info(f"Inserted new document: {unique_identifier} (ID: {result.upserted_id})")
-            elif result.modified_count > 0:
-                logger.info(f"Updated existing document: {unique_identifier}")
-            else:
-                logger.debug(f"Document: {unique_identifier} already exists and no changes detected.")
             return True
-        
+
+        except BulkWriteError as e:
+            write_errors = self._real_write_errors(e)
+            if write_errors:
+                logger.error(f"Bulk write completed with errors: {write_errors}")
+                return False
+            return True
+
         except Exception as e:
-            logger.error(f"Error saving document to MongoDB for {unique_identifier}: {e}")
+            logger.error(f"Error bulk writing documents to MongoDB: {e}")
             return False
-        
-    def collect_github_repo_data(self, repo_url: str, branch: str = "master"):
-        
-        if not repo_url:
-            logger.info("No GitHub repository URL provided")
-            return
-        
+
+    def _parse_repo_url(self, repo_url: str) -> Optional[Tuple[str, str, str]]:
+        """
+        Parse a repository URL into (owner, repo_name, repo_full_url).
+        Returns None if the URL cannot be parsed.
+        """
         try:
             clean_url = repo_url.split('?')[0]
-            path_parts = clean_url.strip('/').split('/')
+            split = urlsplit(clean_url)
+            path_parts = split.path.strip('/').split('/')
             owner = path_parts[-2]
             repo_name = path_parts[-1]
-            
+
             if not owner or not repo_name:
                 raise ValueError("Could not parse owner and repo_name from provided URL.")
-            
-            repo_full_url = f"https://github.com/{owner}/{repo_name}"
-            
+
+            # Keep the original host: the archive fast path only exists for
+            # github.com, every other host takes the clone fallback.
+            host = split.netloc or "github.com"
+            scheme = split.scheme or "https"
+            return owner, repo_name, f"{scheme}://{host}/{owner}/{repo_name}"
+
         except Exception as e:
             logger.error(f"Invalid GitHub repository URL format: {repo_url}. Error: {e}")
+            return None
+
+    def collect_github_repo_data(self, repo_url: str, branch: str = "master"):
+
+        if not repo_url:
+            logger.info("No GitHub repository URL provided")
             return
-        
+
+        parsed = self._parse_repo_url(repo_url)
+        if parsed is None:
+            return
+        owner, repo_name, repo_full_url = parsed
+
         logger.info(f"Scraping GitHub repository: {repo_full_url}")
-        
+
         try:
-            temp_repo_path = f"/tmp/{owner}_{repo_name}"
-            
-            loader = GitLoader(
-                repo_path=temp_repo_path,
-                clone_url=repo_full_url,
-                branch=branch,
-                file_filter=lambda file_path: file_path.endswith((".md", ".txt", ".pdf", ".docx", ".html"))
-            )
-            
-            langchain_docs: List[Document] = loader.load()
-            
+            if "github.com" in repo_full_url:
+                file_iterator = self._iter_archive_files(owner, repo_name, branch)
+            else:
+                file_iterator = self._iter_cloned_files(repo_full_url, owner, repo_name, branch)
+
             repo_processed_count = 0
-            
-            if not langchain_docs:
-                logger.info(f"No documents found or loaded from {repo_full_url}")
-                return
-
-            for doc in langchain_docs:
-                document_data = {
-                    "url": doc.metadata.get("source", f"{repo_full_url}/{doc.metadata.get('file_path', 'unknown')}"), 
-                    "content": doc.page_content,
-                    "scraped_at": datetime.utcnow(),
-                    "source_type": "github_repo",
-                    "metadata": {
-                        "repo_url": repo_full_url,
-                        "file_path": doc.metadata.get("file_path"),
-                        "file_type": doc.metadata.get("file_type"),
-                        "branch": branch,
-                        "title": doc.metadata.get("title", os.path.basename(doc.metadata.get("file_path", "unknown_file"))),
-                    }
-                }
-                
-                if self.save_document(document_data):
+            build_document = self._make_document_builder(repo_full_url, branch)
+
+            for file_path, content in file_iterator:
+                if self.save_document(build_document(file_path, content)):
                     repo_processed_count += 1
-            
+
+            self.flush()
+
+            if repo_processed_count == 0:
+                logger.info(f"No documents found or loaded from {repo_full_url}")
+
             logger.info(f"Finished scraping {repo_full_url}. Documents processed/updated: {repo_processed_count}.")
-            
-            # Clean up temporary directory
-            import shutil
-            if os.path.exists(temp_repo_path):
-                shutil.rmtree(temp_repo_path)
+
+        except httpx.HTTPError as e:
+            logger.error(f"Archive download failed for {repo_full_url}: {e}")
+
+        except subprocess.CalledProcessError as e:
+            logger.error(f"git clone failed for {repo_full_url}: {e.stderr.decode(errors='ignore')}")
 
         except Exception as e:
             logger.error(f"An error occurred during GitHub repo scraping for {repo_full_url}: {e}")
-        
-        time.sleep(2) 
+
+        time.sleep(2)
+
+    def _make_document_builder(self, repo_full_url: str, branch: str):
+        """
+        Return a per-repo document builder with all loop-invariant fields
+        (timestamp, source type, repo metadata) computed once, so the hot
+        per-file loop only fills in what actually varies.
+        """
+        base = {"scraped_at": datetime.utcnow(), "source_type": "github_repo"}
+        base_meta = {"repo_url": repo_full_url, "branch": branch}
+
+        def build_document(file_path: str, content: str) -> Dict:
+            return {
+                **base,
+                "url": f"{repo_full_url}/blob/{branch}/{file_path}",
+                "content": content,
+                "content_hash": xxhash.xxh3_64_hexdigest(content.encode()),
+                "metadata": {
+                    **base_meta,
+                    "file_path": file_path,
+                    "file_type": os.path.splitext(file_path)[1],
+                    "title": os.path.basename(file_path),
+                }
+            }
+
+        return build_document
+
+    async def collect_github_repos_async(self, repo_urls: List[str], branch: str = "master",
+                                         max_concurrency: int = 8):
+        """
+        Ingest several repositories concurrently. Archive downloads run on
+        the event loop (bounded by a semaphore) while ZIP parsing and the
+        Mongo bulk writes are pushed to worker threads, so total wall time
+        approaches the slowest repo rather than the sum of all of them.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async with httpx.AsyncClient(follow_redirects=True, timeout=60.0) as client:
+            results = await asyncio.gather(
+                *(self._collect_repo_async(client, semaphore, repo_url, branch)
+                  for repo_url in repo_urls),
+                return_exceptions=True
+            )
+
+        for repo_url, result in zip(repo_urls, results):
+            if isinstance(result, Exception):
+                logger.error(f"Async ingestion failed for {repo_url}: {result}")
+
+    async def _collect_repo_async(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore,
+                                  repo_url: str, branch: str) -> int:
+        parsed = self._parse_repo_url(repo_url)
+        if parsed is None:
+            return 0
+        owner, repo_name, repo_full_url = parsed
+
+        if "github.com" not in repo_full_url:
+            # codeload only serves GitHub; other hosts go through the
+            # blocking clone path in a worker thread.
+            await asyncio.to_thread(self.collect_github_repo_data, repo_url, branch)
+            return 0
+
+        archive_url = f"https://codeload.github.com/{owner}/{repo_name}/zip/refs/heads/{branch}"
+        archive_file = tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024)
+
+        async with semaphore:
+            async with client.stream("GET", archive_url) as response:
+                response.raise_for_status()
+                async for data in response.aiter_bytes():
+                    archive_file.write(data)
+
+        archive_file.seek(0)
+
+        count = await asyncio.to_thread(self._ingest_archive, archive_file, repo_full_url, branch)
+        logger.info(f"Finished scraping {repo_full_url}. Documents processed/updated: {count}.")
+        return count
+
+    def _ingest_archive(self, archive_file, repo_full_url: str, branch: str) -> int:
+        """
+        Parse a downloaded archive and bulk-upsert its documents. Runs in a
+        worker thread, so it keeps its own operation list instead of the
+        shared save_document buffer.
+        """
+        operations = []
+        build_document = self._make_document_builder(repo_full_url, branch)
+
+        try:
+            for file_path, content in self._iter_zip_entries(archive_file):
+                operations.append(self._upsert_op(build_document(file_path, content)))
+        finally:
+            archive_file.close()
+
+        if not operations:
+            logger.info(f"No documents found or loaded from {repo_full_url}")
+            return 0
+
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            write_errors = self._real_write_errors(e)
+            if write_errors:
+                logger.error(f"Bulk write completed with errors: {write_errors}")
+
+        return len(operations)
+
+    def _iter_archive_files(self, owner: str, repo_name: str, branch: str):
+        """
+        Download the branch snapshot as a ZIP archive (no git history, no
+        .git metadata) and yield (relative_path, text_content) per entry.
+        """
+        archive_url = f"https://codeload.github.com/{owner}/{repo_name}/zip/refs/heads/{branch}"
+
+        with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as archive_file:
+            with httpx.stream("GET", archive_url, follow_redirects=True, timeout=60.0) as response:
+                response.raise_for_status()
+                for data in response.iter_bytes():
+                    archive_file.write(data)
+
+            archive_file.seek(0)
+            yield from self._iter_zip_entries(archive_file)
+
+    def _iter_zip_entries(self, archive_file):
+        """
+        Yield (relative_path, text_content) for supported entries of an
+        open ZIP archive file object.
+        """
+        with zipfile.ZipFile(archive_file) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                if os.path.splitext(info.filename)[1].lower() not in ALLOWED_EXTENSIONS:
+                    continue
+
+                # Guard against Zip Slip style entries before trusting the path.
+                if os.path.isabs(info.filename) or ".." in info.filename.split("/"):
+                    logger.warning(f"Skipping suspicious archive entry: {info.filename}")
+                    continue
+
+                # Strip the leading "{repo}-{branch}/" archive prefix.
+                relative_path = info.filename.split("/", 1)[-1]
+                content = _text_from_bytes(relative_path, zf.read(info))
+                if content is None:
+                    continue
+                yield relative_path, content
+
+    def _iter_cloned_files(self, repo_full_url: str, owner: str, repo_name: str, branch: str):
+        """
+        Fallback for non-GitHub hosts: keep a persistent bare repository
+        cache, refresh it with a shallow fetch on re-runs, and extract the
+        tree via git archive into a scratch directory.
+        """
+        bare_repo_path = f"/tmp/{owner}_{repo_name}.git"
+
+        if os.path.isfile(os.path.join(bare_repo_path, 'HEAD')):
+            # Cache hit: only fetch what changed since the last run.
+            subprocess.run(
+                [
+                    "git", "-C", bare_repo_path,
+                    "fetch", "--depth", "1",
+                    "origin", f"+refs/heads/{branch}:refs/heads/{branch}"
+                ],
+                check=True,
+                capture_output=True
+            )
+        else:
+            subprocess.run(
+                [
+                    "git", "clone",
+                    "--bare",
+                    "--depth", "1",
+                    "--single-branch",
+                    "--branch", branch,
+                    "--filter=blob:none",
+                    repo_full_url,
+                    bare_repo_path
+                ],
+                check=True,
+                capture_output=True
+            )
+
+        # The scratch tree lives inside a TemporaryDirectory context, so it
+        # is cleaned up even if extraction or the consumer of this generator
+        # blows up mid-iteration. The bare cache is kept for the next run.
+        with tempfile.TemporaryDirectory(
+            prefix=f"{owner}_{repo_name}_", ignore_cleanup_errors=True
+        ) as work_dir:
+            archive = subprocess.run(
+                ["git", "-C", bare_repo_path, "archive", "--format=tar", branch],
+                check=True,
+                capture_output=True
+            )
+            subprocess.run(["tar", "-x", "-C", work_dir], input=archive.stdout, check=True)
+
+            yield from self._iter_repo_files(work_dir)
+
+    def _iter_repo_files(self, repo_path: str):
+        """
+        Walk a checked-out repository and yield (relative_path, text_content)
+        for every file with a supported extension. Parsing is fanned out to
+        a process pool so PDF extraction runs outside the GIL.
+        """
+        candidate_paths = []
+        for root, dirs, files in os.walk(repo_path):
+            if '.git' in dirs:
+                dirs.remove('.git')
+
+            for file_name in files:
+                if os.path.splitext(file_name)[1].lower() in ALLOWED_EXTENSIONS:
+                    candidate_paths.append(os.path.join(root, file_name))
+
+        if not candidate_paths:
+            return
+
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for full_path, content in executor.map(_parse_file, candidate_paths, chunksize=16):
+                if content is None:
+                    continue
+                yield os.path.relpath(full_path, repo_path), content
 
     def __del__(self):
+        try:
+            self.flush()
+        except Exception:
+            pass
         if self.db_manager:
             self.db_manager.close()
\ No newline at end of file
@@ -5,6 +5,37 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# One client per URI, shared across instances (and across FastAPI workers
+# in the same process) so everyone draws from the same warmed pool.
+_shared_clients = {}
+
+
+def get_shared_client(mongo_uri: str) -> MongoClient:
+    client = _shared_clients.get(mongo_uri)
+    if client is None:
+        client = MongoClient(
+            mongo_uri,
+            serverSelectionTimeoutMS=5000,
+            connectTimeoutMS=10000,
+            socketTimeoutMS=10000,
+            maxPoolSize=50,
+            minPoolSize=5,
+            maxIdleTimeMS=30000,
+            waitQueueTimeoutMS=10000,
+            retryWrites=True,
+            compressors="zstd,snappy"
+        )
+        _shared_clients[mongo_uri] = client
+    return client
+
+
+def close_shared_clients():
+    """Close every pooled client; for process shutdown only."""
+    while _shared_clients:
+        _, client = _shared_clients.popitem()
+        client.close()
+
+
 class NigerianLawsDatabase:
     
     def __init__(self, mongo_uri: str, db_name: str):
@@ -23,12 +54,7 @@ class NigerianLawsDatabase:
         Establish connection to MongoDB and returns True if successful or False if otherwise
         """
         try:
-            self.client = MongoClient(
-                self.mongo_uri,
-                serverSelectionTimeoutMS=5000,
-                connectTimeoutMS=10000,
-                socketTimeoutMS=10000
-            )
+            self.client = get_shared_client(self.mongo_uri)
             self.client.admin.command('ping')
             self.db = self.client[self.db_name]
             logger.info(f"Successfully connected to MongoDB: {self.db_name}")
@@ -53,6 +79,10 @@ class NigerianLawsDatabase:
         return self.db[collection_name]
 
     def close(self):
+        # Drop this instance's reference only: the underlying client is the
+        # shared per-URI pool and may be in use by other holders, so its
+        # lifetime belongs to the process (closed via close_shared_clients).
         if self.client:
-            self.client.close()
-            logger.info("MongoDB connection closed.")
\ No newline at end of file
+            self.client = None
+            self.db = None
+            logger.info("MongoDB connection released.")
\ No newline at end of file
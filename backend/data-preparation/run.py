@@ -1,3 +1,4 @@
+import asyncio
 import logging
 
 from .data_collector import DataCollector, TARGET_GITHUB_REPO_URL
@@ -16,7 +17,9 @@ def run_data_collection_pipeline():
         
         if TARGET_GITHUB_REPO_URL:
             logger.info(f"Starting GitHub repository scraping from: {TARGET_GITHUB_REPO_URL}")
-            data_collector.collect_github_repo_data(TARGET_GITHUB_REPO_URL, branch="master")
+            asyncio.run(
+                data_collector.collect_github_repos_async([TARGET_GITHUB_REPO_URL], branch="master")
+            )
         else:
             logger.info("No target GitHub repository URL defined.")
             
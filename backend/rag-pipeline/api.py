@@ -5,9 +5,10 @@ from pydantic import BaseModel, Field
 from typing import Optional, Set
 import time
 from datetime import datetime
-import json
 import logging
 
+import orjson
+
 from .llm_interaction import NigerianLawRAG 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -40,6 +41,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+
+
+def sse_event(payload: dict) -> bytes:
+    """
+    Frame a payload as a Server-Sent Events data line. orjson serializes
+    straight to bytes, so no per-chunk str formatting or encode is needed.
+    """
+    return _SSE_PREFIX + orjson.dumps(payload) + _SSE_SUFFIX
+
+
 class QuestionRequest(BaseModel):
     question: str = Field(..., min_length=1, description="The question to ask the AI assistant.")
     
@@ -71,8 +84,12 @@ async def ask_question_stream(request: QuestionRequest):
         
         try:
             start_time = time.time()
-            relevant_info = rag_system.search_relevant_chunks(question, top_k=top_k)
-            
+            relevant_info, best_score = await rag_system.search_relevant_chunks_async(question, top_k=top_k)
+
+            if best_score < rag_system.relevance_score_threshold:
+                logger.info(f"Best retrieval score {best_score:.3f} below threshold; answering without context.")
+                relevant_info = []
+
             context_parts = []
             context_length = 0
             
@@ -97,10 +114,10 @@ async def ask_question_stream(request: QuestionRequest):
                         "content": "No highly relevant information found in the knowledge base for this question. "
                         "Attempting to generate an answer with limited context."
                     }
-                yield f"data: {json.dumps(no_context_message)}\n\n"
+                yield sse_event(no_context_message)
                     
             logger.info(f"Generating answer using {rag_system.model_name} for: '{question[:50]}...'")
-            prompt = rag_system.prompt_template.format(context=context, question=question)
+            prompt = rag_system.build_answer_prompt(context, question)
             
             initial_metadata = {
                     "type": "metadata",
@@ -108,22 +125,24 @@ async def ask_question_stream(request: QuestionRequest):
                     "context_chunks_used": len(context_parts),
                     "model": rag_system.model_name
                 }
-            yield f"data: {json.dumps(initial_metadata)}\n\n"
+            yield sse_event(initial_metadata)
                         
-            full_answer_content = ""
-            
+            # Buffer chunks in a list and join once at the end; repeated
+            # string concatenation is quadratic over long answers.
+            answer_parts = []
+
             async for chunk_content in rag_system.llm.astream(prompt):
                 chunk_data = {"type": "chunk", "content": chunk_content}
-                yield f"data: {json.dumps(chunk_data)}\n\n"
-                full_answer_content += chunk_content
-                
+                yield sse_event(chunk_data)
+                answer_parts.append(chunk_content)
+
             final_message = {
                 "type": "end",
-                "full_answer": full_answer_content,
+                "full_answer": "".join(answer_parts),
                 "timestamp": datetime.now().isoformat(),
                 "generation_time": f"{time.time() - start_time:.2f} seconds"
             }
-            yield f"data: {json.dumps(final_message)}\n\n"
+            yield sse_event(final_message)
             
         except Exception as e:
             logger.error(f"Error during streaming response generation for question '{question[:50]}...': {e}", exc_info=True)
@@ -132,7 +151,7 @@ async def ask_question_stream(request: QuestionRequest):
                 "error": str(e),
                 "timestamp": datetime.now().isoformat()
             }
-            yield f"data: {json.dumps(error_message)}\n\n"
+            yield sse_event(error_message)
     
     return StreamingResponse(
         generate_chunks(),
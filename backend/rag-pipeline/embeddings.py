@@ -0,0 +1,187 @@
+import os
+import logging
+import functools
+from typing import List
+
+import numpy as np
+import torch
+
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+
+# One torch thread per forward pass: request-level concurrency supplies the
+# parallelism, and N concurrent requests each spawning N threads
+# oversubscribes the host.
+torch.set_num_threads(int(os.getenv("TORCH_NUM_THREADS", "1")))
+try:
+    torch.set_num_interop_threads(1)
+except RuntimeError:
+    # Interop threads can only be set once per process.
+    pass
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Exported offline with:
+#   optimum-cli export onnx --model sentence-transformers/all-MiniLM-L6-v2 out/
+#   onnxruntime.quantization.quantize_dynamic(..., weight_type=QuantType.QInt8)
+ONNX_MODEL_PATH = os.getenv("ONNX_EMBEDDING_MODEL_PATH", "/app/data/minilm-int8.onnx")
+
+
+# Texts per ONNX forward pass: one padded run over a whole corpus would
+# materialize N x max_len hidden states at once.
+ENCODE_BATCH_SIZE = int(os.getenv("EMBED_ENCODE_BATCH_SIZE", "256"))
+
+
+def _encode_in_batches(encode_fn, texts: List[str]) -> List[List[float]]:
+    if not texts:
+        return []
+    batches = [
+        encode_fn(texts[start:start + ENCODE_BATCH_SIZE])
+        for start in range(0, len(texts), ENCODE_BATCH_SIZE)
+    ]
+    return np.vstack(batches).tolist()
+
+
+def _mean_pool(token_embeddings: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """Mean pooling over non-padding tokens, then L2 normalization."""
+    mask = attention_mask[..., np.newaxis].astype(np.float32)
+    summed = (token_embeddings * mask).sum(axis=1)
+    counts = np.clip(mask.sum(axis=1), 1e-9, None)
+    embeddings = summed / counts
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.clip(norms, 1e-9, None)
+
+
+class OnnxMiniLMEmbeddings(Embeddings):
+    """
+    MiniLM embeddings served through ONNX Runtime with int8 weights.
+    Runs the quantized transformer on the CPUExecutionProvider (VNNI int8
+    kernels where available) and does mean pooling + normalization in NumPy.
+    """
+
+    def __init__(self, model_path: str):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME)
+        self.session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=256,
+            return_tensors="np"
+        )
+
+        inputs = {k: v.astype(np.int64) for k, v in encoded.items() if k in self._input_names}
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        return _mean_pool(token_embeddings, encoded["attention_mask"])
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return _encode_in_batches(self._encode, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+class OptimumMiniLMEmbeddings(Embeddings):
+    """
+    MiniLM served through optimum's ORTModelForFeatureExtraction: the
+    checkpoint is exported to ONNX at load time and runs on ONNX Runtime
+    graph-optimized kernels, with pooling done in NumPy.
+    """
+
+    def __init__(self):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+
+        session_options = ort.SessionOptions()
+        session_options.intra_op_num_threads = os.cpu_count()
+
+        self.tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            EMBEDDING_MODEL_NAME,
+            export=True,
+            provider="CPUExecutionProvider",
+            session_options=session_options
+        )
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=256,
+            return_tensors="pt"
+        )
+
+        outputs = self.model(**encoded)
+        token_embeddings = outputs.last_hidden_state.numpy()
+
+        return _mean_pool(token_embeddings, encoded["attention_mask"].numpy())
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return _encode_in_batches(self._encode, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+@functools.lru_cache(maxsize=1)
+def get_embedding_model() -> Embeddings:
+    """
+    Return the fastest available MiniLM embedder, in order of preference:
+    the pre-quantized int8 ONNX model, an optimum/ONNX Runtime export of
+    the checkpoint, then the regular HuggingFace PyTorch path.
+
+    Cached as a process-wide singleton: the RAG and the preprocessor share
+    one copy of the weights/session instead of each loading ~90 MB and
+    paying the cold start twice.
+    """
+    if os.path.exists(ONNX_MODEL_PATH):
+        try:
+            model = OnnxMiniLMEmbeddings(ONNX_MODEL_PATH)
+            print(f"Loaded int8 ONNX embedding model from {ONNX_MODEL_PATH}")
+            return model
+        except ImportError:
+            logger.warning("onnxruntime not installed; falling back to the PyTorch embedder.")
+        except Exception as e:
+            logger.warning(f"Failed to load ONNX embedding model: {e}; falling back.")
+
+    try:
+        model = OptimumMiniLMEmbeddings()
+        print("Loaded MiniLM via optimum ORTModelForFeatureExtraction.")
+        return model
+    except ImportError:
+        logger.debug("optimum not installed; using the PyTorch embedder.")
+    except Exception as e:
+        logger.warning(f"Failed to load optimum ONNX embedder: {e}; falling back to PyTorch.")
+
+    # normalize_embeddings keeps this tier consistent with the ONNX ones,
+    # which L2-normalize in _mean_pool; downstream similarity gating
+    # assumes unit-length vectors.
+    model = HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        encode_kwargs={"normalize_embeddings": True},
+    )
+
+    # Opt-in reduced precision for the PyTorch path; worthwhile on CPUs
+    # with AVX512-BF16/FP16, harmful on ones without, so off by default.
+    dtype_name = os.getenv("EMBEDDING_DTYPE", "").lower()
+    if dtype_name in ("bfloat16", "float16"):
+        try:
+            model.client.to(dtype=getattr(torch, dtype_name))
+            print(f"Embedding model cast to {dtype_name}.")
+        except Exception as e:
+            logger.warning(f"Could not cast embedding model to {dtype_name}: {e}")
+
+    return model
@@ -1,14 +1,29 @@
 import os
-from typing import List, Dict, Optional
+import re
+import json
+import time
+import asyncio
+import hashlib
+import functools
+import threading
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 import logging
 
-from langchain_huggingface import HuggingFaceEmbeddings
+import faiss
+import numpy as np
+from cachetools import TTLCache
+
 from langchain_ollama import OllamaLLM
 from langchain_community.vectorstores import FAISS
 from langchain.prompts import PromptTemplate
 from langchain_core.documents import Document
 
+try:
+    from .embeddings import get_embedding_model
+except ImportError:
+    from embeddings import get_embedding_model
+
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -18,6 +33,145 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Tokens typical of greetings/small talk rather than legal questions.
+_CONVERSATIONAL_WORDS = frozenset({
+    "hi", "hello", "hey", "howdy", "thanks", "thank", "you", "ok", "okay",
+    "bye", "goodbye", "yes", "no", "please", "good", "morning", "afternoon",
+    "evening", "how", "are", "doing", "what's", "whats", "up",
+})
+
+
+class SearchResultCache:
+    """
+    Caches the top-k faiss ids and best score for a normalized query. A hit
+    skips the query rewrite (LLM), the MiniLM forward pass and the FAISS
+    search. Backed by Redis when REDIS_URL is set so hits are shared across
+    workers; otherwise an in-process TTL dict.
+    """
+
+    def __init__(self, ttl_seconds: int = 6 * 3600, max_local_entries: int = 4096):
+        self._ttl = ttl_seconds
+        self._max_local_entries = max_local_entries
+        self._local: Dict[str, Tuple[float, List[int], float]] = {}
+
+        self._redis = None
+        redis_url = os.getenv("REDIS_URL")
+        if redis_url:
+            try:
+                import redis
+                self._redis = redis.Redis.from_url(redis_url)
+                self._redis.ping()
+                logger.info("Search result cache backed by Redis.")
+            except Exception as e:
+                logger.warning(f"Redis unavailable for search cache, using in-process cache: {e}")
+                self._redis = None
+
+    @staticmethod
+    def _key(normalized_query: str) -> str:
+        return "nigerianlaws:search:" + hashlib.sha256(normalized_query.encode()).hexdigest()
+
+    def get_ids(self, normalized_query: str, top_k: int) -> Optional[Tuple[List[int], float]]:
+        key = self._key(normalized_query)
+
+        if self._redis is not None:
+            try:
+                raw = self._redis.get(key)
+                if raw is not None:
+                    entry = json.loads(raw)
+                    if len(entry["ids"]) >= top_k:
+                        return entry["ids"][:top_k], float(entry.get("score", float('-inf')))
+            except Exception as e:
+                logger.warning(f"Search cache read failed: {e}")
+            return None
+
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        expires_at, ids, score = entry
+        if expires_at < time.monotonic() or len(ids) < top_k:
+            self._local.pop(key, None)
+            return None
+        return ids[:top_k], score
+
+    def put(self, normalized_query: str, ids: List[int], score: float):
+        key = self._key(normalized_query)
+
+        if self._redis is not None:
+            try:
+                payload = json.dumps({"ids": list(ids), "score": score})
+                self._redis.setex(key, self._ttl, payload)
+            except Exception as e:
+                logger.warning(f"Search cache write failed: {e}")
+            return
+
+        if len(self._local) >= self._max_local_entries:
+            # Drop the oldest insertion; plain dicts preserve order.
+            self._local.pop(next(iter(self._local)), None)
+        self._local[key] = (time.monotonic() + self._ttl, list(ids), score)
+
+
+class QueryBatcher:
+    """
+    Dynamic batching for embedding+search: concurrent requests queue up,
+    a worker drains up to max_batch of them every collect window, and the
+    whole group is served with one array-input MiniLM encode + one batched
+    FAISS search instead of a model round-trip per request. Window and
+    batch size are tunable via EMBED_BATCH_WINDOW_MS / EMBED_MAX_BATCH.
+    """
+
+    def __init__(self, rag: "NigerianLawRAG",
+                 window_ms: Optional[float] = None, max_batch: Optional[int] = None):
+        self._rag = rag
+        if window_ms is None:
+            window_ms = float(os.getenv("EMBED_BATCH_WINDOW_MS", "20"))
+        if max_batch is None:
+            max_batch = int(os.getenv("EMBED_MAX_BATCH", "32"))
+        self._window = window_ms / 1000.0
+        self._max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_worker(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._worker())
+
+    async def search(self, query: str, top_k: int):
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, top_k, future))
+        return await future
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._window
+
+            while len(batch) < self._max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            queries = [query for query, _, _ in batch]
+            max_k = max(top_k for _, top_k, _ in batch)
+
+            try:
+                results = await asyncio.to_thread(self._rag.batched_search, queries, max_k)
+                for (_, top_k, future), (ids, docs, best_score) in zip(batch, results):
+                    if not future.done():
+                        future.set_result((ids[:top_k], docs[:top_k], best_score))
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
 class NigerianLawRAG:
     
     def __init__(self, model_type: str = "ollama", model_name: Optional[str] = None):
@@ -26,8 +180,11 @@ class NigerianLawRAG:
         self.model_type = model_type
         self.model_name = os.getenv("OLLAMA_MODEL_NAME")
         self.max_context_length = 3500
+        # Minimum cosine similarity of the best retrieved chunk for the
+        # corpus to be considered relevant to the question.
+        self.relevance_score_threshold = float(os.getenv("RELEVANCE_SCORE_THRESHOLD", "0.3"))
         
-        self.embedding_model = HuggingFaceEmbeddings(model_name='sentence-transformers/all-MiniLM-L6-v2')
+        self.embedding_model = get_embedding_model()
         print("Embedding model loaded.")
         
         self.llm = self.initialize_llm()
@@ -45,7 +202,9 @@ class NigerianLawRAG:
 
             Original Query: {original_query}
 
-            Enhanced Legal Search Query:""",
+            Write 3 alternative search queries covering these aspects, one per line, with no numbering or commentary.
+
+            Alternative Search Queries:""",
             input_variables=["original_query"]
         )
         
@@ -57,17 +216,33 @@ class NigerianLawRAG:
             input_variables=["question"]
         )
         
-        self.prompt_template = PromptTemplate(
-            template="""you are an expert on Nigerian law answer this user's 
-                {question}
+        # Static halves of the single-variable templates, split once so the
+        # per-query render is plain string concatenation instead of
+        # LangChain's dict substitution.
+        self._rewrite_prompt_prefix, self._rewrite_prompt_suffix = \
+            self.query_rewrite_prompt.template.split("{original_query}")
+        self._unrelated_prompt_prefix, self._unrelated_prompt_suffix = \
+            self.unrelated_query_prompt.template.split("{question}")
 
-                based on the following context {context}
+        # Pre-rendered once: the static instruction block leads the prompt
+        # so it is byte-identical across requests, letting Ollama reuse the
+        # prefix KV cache instead of re-prefilling it per query.
+        self._answer_prompt_prefix = (
+            "you are an expert on Nigerian law. Answer the user's question "
+            "based on the provided context.\n\n"
+            "- You must answer the question directly and nothing more.\n\n"
+        )
 
-                - You must answer the question directly and nothing more.
+        # TTL-bounded so stale rewrites/answers age out instead of living
+        # for the whole process lifetime. TTLCache is not thread-safe and
+        # _expand_query runs via asyncio.to_thread, so all access goes
+        # through one lock.
+        self._rewrite_cache = TTLCache(maxsize=2048, ttl=3600)
+        self._answer_cache = TTLCache(maxsize=512, ttl=3600)
+        self._cache_lock = threading.Lock()
 
-                Answer:""",
-                input_variables=["context", "question"]
-        )
+        self.query_batcher = QueryBatcher(self)
+        self.search_cache = SearchResultCache()
 
     def initialize_llm(self):
         return OllamaLLM(
@@ -81,7 +256,18 @@ class NigerianLawRAG:
     
     def load_vector_store(self):
         print(f"Loading FAISS index from: {self.faiss_index_path}")
-        
+
+        # With OMP_NUM_THREADS unset, some faiss builds default to a single
+        # OpenMP thread; pin the pool to the core count explicitly.
+        faiss.omp_set_num_threads(os.cpu_count())
+
+        compile_options = faiss.get_compile_options()
+        if not any(opt in compile_options for opt in ("AVX512", "AVX2", "avx512", "avx2")):
+            logger.warning(
+                f"faiss built without AVX2/AVX512 ({compile_options.strip() or 'no options'}); "
+                "distance kernels will run scalar. Install a SIMD-enabled faiss-cpu build."
+            )
+
         try:
             faiss_vector_store = FAISS.load_local(
                 folder_path=self.faiss_index_path,
@@ -89,52 +275,331 @@ class NigerianLawRAG:
                 allow_dangerous_deserialization=True
             )
             print("FAISS index loaded successfully.")
+            self._tune_faiss_index(faiss_vector_store)
+
+            # Hot-path handles: raw faiss index plus docstore mapping, so
+            # query-time search skips the LangChain wrapper entirely.
+            self._raw_index = faiss_vector_store.index
+            self._id_map = faiss_vector_store.index_to_docstore_id
+            self._docstore = faiss_vector_store.docstore._dict
+
+            # Flat list aligned with faiss ids: resolving a hit is one list
+            # index instead of two dict lookups.
+            self._docs = [
+                self._docstore[self._id_map[i]] for i in range(len(self._id_map))
+            ]
+
+            # Exact FP32 vectors written by the preprocessor; used to rerank
+            # candidates from the quantized index. mmap keeps them off-heap.
+            rerank_path = os.path.join(self.faiss_index_path, "embeddings_fp32.npy")
+            if os.path.exists(rerank_path):
+                self._rerank_matrix = np.load(rerank_path, mmap_mode='r')
+                print("FP32 rerank matrix loaded (mmap).")
+            else:
+                self._rerank_matrix = None
+
+            # Optional 1-bit Hamming index for first-stage retrieval; only
+            # usable with the FP32 matrix to rerank its candidates.
+            binary_path = os.path.join(self.faiss_index_path, "index.binary")
+            if os.path.exists(binary_path) and self._rerank_matrix is not None:
+                self._binary_index = faiss.read_index_binary(binary_path)
+                print("Binary first-stage index loaded.")
+            else:
+                self._binary_index = None
+
+            # Indexes built before the preprocessor normalized vectors (and
+            # started writing the FP32 matrix) are L2 over raw embeddings;
+            # their distances cannot be mapped to cosines, so the relevance
+            # gate must not judge them.
+            self._legacy_unnormalized = (
+                self._raw_index.metric_type != faiss.METRIC_INNER_PRODUCT
+                and self._rerank_matrix is None
+            )
+            if self._legacy_unnormalized:
+                logger.warning(
+                    "Legacy unnormalized L2 index detected; relevance gate "
+                    "disabled. Re-run preprocessing to rebuild the index."
+                )
+                self.relevance_score_threshold = float('-inf')
+
             return faiss_vector_store
         except Exception as e:
             print(f"Error loading FAISS index: {e}")
             raise
     
-    def _rewrite_query(self, query: str) -> str:
-        rewrite_prompt_formatted = self.query_rewrite_prompt.format(original_query=query)
-        rewritten_query = self.llm.invoke(rewrite_prompt_formatted)
-        logger.debug(f"Rewritten query: '{rewritten_query.strip()}'") 
-        return rewritten_query.strip()
-        
-    def search_relevant_chunks(self, query: str, top_k: int) -> List[Document]:
-        
-        rewritten_query = self._rewrite_query(query)
-        
+    def _tune_faiss_index(self, faiss_vector_store):
+        """
+        Tune the loaded index for query-time search: set HNSW/IVF search
+        parameters when present and offload to GPU when faiss was built
+        with GPU support.
+        """
+        index = faiss_vector_store.index
+
+        if hasattr(index, 'hnsw'):
+            index.hnsw.efSearch = 64
+            print("HNSW index detected, efSearch set to 64.")
+        else:
+            # extract_index_ivf walks wrappers like the OPQ tier's
+            # IndexPreTransform, where a top-level nprobe attribute does not
+            # exist and the inner IVF would otherwise stay at nprobe=1.
+            try:
+                faiss.extract_index_ivf(index).nprobe = 16
+                print("IVF index detected, nprobe set to 16.")
+            except RuntimeError:
+                logger.debug("Flat FAISS index loaded; brute-force search will be used.")
+
+        if hasattr(faiss, 'StandardGpuResources'):
+            try:
+                gpu_resources = faiss.StandardGpuResources()
+                faiss_vector_store.index = faiss.index_cpu_to_gpu(gpu_resources, 0, index)
+                print("FAISS index moved to GPU.")
+            except Exception as e:
+                logger.warning(f"GPU offload unavailable, keeping FAISS index on CPU: {e}")
+
+    def build_answer_prompt(self, context: str, question: str) -> str:
+        return f"{self._answer_prompt_prefix}Context:\n{context}\n\nQuestion: {question}\n\nAnswer:"
+
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def _is_conversational(normalized_query: str) -> bool:
+        """
+        Queries under four tokens or made entirely of small-talk words have
+        no legal semantics for the rewrite to enrich; classifying them up
+        front skips that whole LLM round-trip.
+        """
+        tokens = normalized_query.split()
+        if len(tokens) < 4:
+            return True
+        return all(token.strip('.,!?') in _CONVERSATIONAL_WORDS for token in tokens)
+
+    # List markers only ("1. ", "2) ", "- ", "* "): a bare leading number
+    # must survive, e.g. the year in "1999 Constitution".
+    _EXPANSION_PREFIX_RE = re.compile(r'^\s*(?:\d{1,2}[.)\]]\s*|[-*]\s+)')
+
+    @classmethod
+    def _parse_expansions(cls, raw: str) -> List[str]:
+        candidates = []
+        for line in raw.splitlines():
+            line = cls._EXPANSION_PREFIX_RE.sub('', line).strip()
+            if line and line not in candidates:
+                candidates.append(line)
+        return candidates[:3]
+
+    def _expand_query(self, query: str) -> List[str]:
+        """
+        One LLM generation producing up to three paraphrased search
+        queries. Keyed on the normalized query so casing/whitespace
+        variants of repeat questions skip the LLM round-trip entirely.
+        """
+        normalized_query = self._normalize_query(query)
+        key = hashlib.sha1(normalized_query.encode()).hexdigest()
+
+        with self._cache_lock:
+            cached = self._rewrite_cache.get(key)
+        if cached is not None:
+            return list(cached)
+
+        rewrite_prompt_formatted = (
+            f"{self._rewrite_prompt_prefix}{normalized_query}{self._rewrite_prompt_suffix}"
+        )
+        candidates = self._parse_expansions(self.llm.invoke(rewrite_prompt_formatted))
+        logger.debug(f"Expanded query into: {candidates}")
+
+        with self._cache_lock:
+            self._rewrite_cache[key] = tuple(candidates)
+        return candidates
+
+    @staticmethod
+    def _fuse_rankings(id_rows: List[List[int]], top_k: int) -> List[int]:
+        # Reciprocal-rank fusion with the standard k=60 constant; rank
+        # positions make scores comparable across the query variants.
+        fused: Dict[int, float] = {}
+        for row in id_rows:
+            for rank, doc_id in enumerate(row):
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (60 + rank)
+        return sorted(fused, key=fused.get, reverse=True)[:top_k]
+
+
+    def _docs_for_ids(self, ids: List[int]) -> List[Document]:
+        return [self._docs[idx] for idx in ids if idx != -1]
+
+    def _search_by_vectors(self, vectors: np.ndarray, top_k: int) -> List[Tuple[List[int], List[Document]]]:
+        """
+        Run one (possibly batched) faiss.Index.search and map the returned
+        ids back to the stored Document objects — no per-query Document
+        construction or wrapper overhead. When the FP32 matrix is present,
+        a wider candidate set from the quantized index is reranked with
+        exact inner products. Returns (ids, documents, best_score) per row
+        so callers can cache the raw ids and compare retrievals; scores are
+        oriented so higher is always better.
+        """
+        # The scores are only cosines if the query side is unit-length too;
+        # the ONNX embedders normalize but the PyTorch fallback may not.
+        if not self._legacy_unnormalized:
+            faiss.normalize_L2(vectors)
+
+        if self._rerank_matrix is None:
+            distances, indices = self._raw_index.search(vectors, top_k)
+            if self._raw_index.metric_type != faiss.METRIC_INNER_PRODUCT:
+                if self._legacy_unnormalized:
+                    # Orientation only — not cosines; the gate is disabled
+                    # for this index.
+                    distances = -distances
+                else:
+                    # Squared L2 over normalized vectors: cos = 1 - d/2, so
+                    # the scores stay comparable with inner-product indexes.
+                    distances = 1.0 - distances / 2.0
+            id_rows = [[int(idx) for idx in row if idx != -1] for row in indices]
+            best_scores = [float(row[0]) if len(row) else float('-inf') for row in distances]
+        else:
+            candidate_k = max(50, top_k)
+
+            if self._binary_index is not None:
+                # Popcount Hamming scan over the 1-bit index for candidates.
+                packed_queries = np.packbits(vectors > 0, axis=1)
+                _, indices = self._binary_index.search(packed_queries, candidate_k)
+            else:
+                _, indices = self._raw_index.search(vectors, candidate_k)
+
+            id_rows, best_scores = self._rerank_rows(vectors, indices, top_k)
+
+        return [
+            (row_ids, self._docs_for_ids(row_ids), best_score)
+            for row_ids, best_score in zip(id_rows, best_scores)
+        ]
+
+    def _rerank_rows(self, vectors: np.ndarray, indices: np.ndarray, top_k: int):
+        id_rows = []
+        best_scores = []
+        for vector, row in zip(vectors, indices):
+            candidate_ids = row[row != -1]
+            scores = self._rerank_matrix[candidate_ids] @ vector
+            order = np.argsort(-scores)[:top_k]
+            id_rows.append([int(idx) for idx in candidate_ids[order]])
+            best_scores.append(float(scores[order[0]]) if len(order) else float('-inf'))
+        return id_rows, best_scores
+
+    def batched_search(self, queries: List[str], top_k: int) -> List[Tuple[List[int], List[Document], float]]:
+        """
+        Embed several queries in one MiniLM forward pass and resolve them
+        with a single batched FAISS search.
+        """
+        vectors = np.asarray(self.embedding_model.embed_documents(queries), dtype='float32')
+        return self._search_by_vectors(vectors, top_k)
+
+    def search_relevant_chunks(self, query: str, top_k: int) -> Tuple[List[Document], float]:
+
+        normalized_query = self._normalize_query(query)
+
+        cached = self.search_cache.get_ids(normalized_query, top_k)
+        if cached is not None:
+            logger.debug(f"Search cache hit for query: '{query[:50]}'")
+            cached_ids, cached_score = cached
+            return self._docs_for_ids(cached_ids), cached_score
+
+        candidates = [query]
+        if not self._is_conversational(normalized_query):
+            candidates += [
+                expansion for expansion in self._expand_query(query)
+                if self._normalize_query(expansion) != normalized_query
+            ]
+
         print(f"Searching for top {top_k} relevant chunks for query: '{query[:50]}'")
-        
-        relevant_documents = self.vector_store.similarity_search(rewritten_query, k=top_k)
-        
+
+        # Original + expansions embedded in one forward pass and resolved
+        # with one batched FAISS search; the variants' rankings are merged
+        # with reciprocal-rank fusion.
+        vectors = np.asarray(
+            self.embedding_model.embed_documents(candidates), dtype='float32'
+        )
+        rows = self._search_by_vectors(vectors, top_k)
+
+        if len(rows) == 1:
+            ids, relevant_documents, best_score = rows[0]
+        else:
+            ids = self._fuse_rankings([row_ids for row_ids, _, _ in rows], top_k)
+            relevant_documents = self._docs_for_ids(ids)
+            best_score = max(score for _, _, score in rows)
+
+        self.search_cache.put(normalized_query, ids, best_score)
+
         logger.info(f"Found {len(relevant_documents)} relevant documents.")
-        return relevant_documents
-    
-    def _is_context_relevant(self, question: str, documents: List[Document]) -> bool:
+        return relevant_documents, best_score
+
+    async def search_relevant_chunks_async(self, query: str, top_k: int) -> Tuple[List[Document], float]:
+        """
+        Async variant used by the API: the LLM query expansion runs
+        concurrently with a speculative retrieval on the raw query, since
+        the expansion only informs retrieval. The expansions are then
+        submitted to the micro-batcher together, so they share one model
+        forward pass and one batched FAISS search, and their rankings are
+        merged with the raw query's by reciprocal-rank fusion.
+        """
+        normalized_query = self._normalize_query(query)
+
+        cached = self.search_cache.get_ids(normalized_query, top_k)
+        if cached is not None:
+            logger.debug(f"Search cache hit for query: '{query[:50]}'")
+            cached_ids, cached_score = cached
+            return self._docs_for_ids(cached_ids), cached_score
+
+        if self._is_conversational(normalized_query):
+            # Nothing for the expansion to enrich; search the raw query only.
+            expansions = []
+            raw_ids, raw_documents, raw_score = \
+                await self.query_batcher.search(query, top_k)
+        else:
+            expansions, (raw_ids, raw_documents, raw_score) = await asyncio.gather(
+                asyncio.to_thread(self._expand_query, query),
+                self.query_batcher.search(query, top_k)
+            )
+
+        expansions = [
+            expansion for expansion in expansions
+            if self._normalize_query(expansion) != normalized_query
+        ]
+
+        if expansions:
+            expansion_rows = await asyncio.gather(
+                *(self.query_batcher.search(expansion, top_k) for expansion in expansions)
+            )
+            ids = self._fuse_rankings(
+                [raw_ids] + [row_ids for row_ids, _, _ in expansion_rows], top_k
+            )
+            relevant_documents = self._docs_for_ids(ids)
+            best_score = max(raw_score, *(score for _, _, score in expansion_rows))
+        else:
+            ids, relevant_documents, best_score = raw_ids, raw_documents, raw_score
+
+        self.search_cache.put(normalized_query, ids, best_score)
+
+        logger.info(f"Found {len(relevant_documents)} relevant documents.")
+        return relevant_documents, best_score
+
 
-        question_keywords = set(question.lower().split())
-        
-        for doc in documents:
-            doc_content = doc.page_content.lower()
-            doc_title = doc.metadata.get("file_path", "").lower()
-            
-            content_words = set(doc_content.split())
-            title_words = set(doc_title.split())
-            
-            overlap = question_keywords.intersection(content_words.union(title_words))
-            
-            if len(overlap) >= 5: 
-                return True
-        
-        return False
-    
     def generate_answer(self, question: str) -> Dict:
-        relevant_documents = self.search_relevant_chunks(question, top_k=7)
-        
-        if not relevant_documents or not self._is_context_relevant(question, relevant_documents):
+        answer_cache_key = (self._normalize_query(question), self.model_name)
+
+        with self._cache_lock:
+            cached_response = self._answer_cache.get(answer_cache_key)
+        if cached_response is not None:
+            logger.debug(f"Answer cache hit for question: '{question[:50]}'")
+            return dict(cached_response)
+
+        relevant_documents, best_score = self.search_relevant_chunks(question, top_k=7)
+
+        # The best chunk's cosine similarity is already computed by the
+        # search; thresholding it replaces the old per-document keyword
+        # overlap scan.
+        if not relevant_documents or best_score < self.relevance_score_threshold:
             
-            prompt_formatted = self.unrelated_query_prompt.format(question=question)
+            prompt_formatted = (
+                f"{self._unrelated_prompt_prefix}{question}{self._unrelated_prompt_suffix}"
+            )
             
             generated_answer = self.llm.invoke(prompt_formatted)
             
@@ -151,30 +616,32 @@ class NigerianLawRAG:
         context_parts = []
         context_length = 0
         sources = set()
-        
+
         for doc in relevant_documents:
             doc_title = doc.metadata.get("file_path")
-            doc_url = doc.metadata.get('url', 'No URL') 
-            chunk_content = doc.page_content
-            
-            source_citation = f"Source: {doc_title} ({doc_url})" if doc_url and doc_url != 'Unknown URL' else f"Source: {doc_title}"
-            
-            chunk_text = f"{source_citation}\nContent: {chunk_content}\n\n"
-            
-            if context_length + len(chunk_text) > self.max_content_length:
+            doc_url = doc.metadata.get('url', 'No URL')
+
+            # Prebuilt at chunking time; fall back to formatting here for
+            # indexes built before the preprocessor started embedding it.
+            chunk_text = doc.metadata.get('_prebuilt_context')
+            if chunk_text is None:
+                source_citation = f"Source: {doc_title} ({doc_url})" if doc_url and doc_url != 'Unknown URL' else f"Source: {doc_title}"
+                chunk_text = f"{source_citation}\nContent: {doc.page_content}\n\n"
+
+            if context_length + len(chunk_text) > self.max_context_length:
                 break
-            
+
             context_parts.append(chunk_text)
             context_length += len(chunk_text)
-            
+
             sources.add(f"{doc_title} ({doc_url})")
-            
+
         context = "".join(context_parts)
         
         logger.debug(f"Generated context for question '{question[:50]}...':\n{context}")
         
         print(f"Generating answer using {self.model_type} ({self.model_name})...")
-        prompt = self.prompt_template.format(context=context, question=question)
+        prompt = self.build_answer_prompt(context, question)
         
         answer = self.llm.invoke(prompt)
         
@@ -186,7 +653,10 @@ class NigerianLawRAG:
             "context_chunks_used": len(context_parts),
             "timestamp": datetime.now().isoformat()
         }
-        
+
+        with self._cache_lock:
+            self._answer_cache[answer_cache_key] = response
+
         return response
     
     def ask_question(self, question: str) -> Dict: